@@ -1,22 +1,119 @@
 # app.py
 import os
-import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import streamlit as st
 
 # Local modules
 from db import (
     init_db,
+    get_conn,
     get_datasets,
-    query_images,
+    count_images,
+    fetch_images,
     set_decision,
     get_marked,
+    data_version,
+    catalog_version,
+    json_loads,
 )
 from ingest import ingest as ingest_cli
 
 # -------- App bootstrap --------
 st.set_page_config(page_title="DatasetCleaner", layout="wide")
-init_db()
+
+@st.cache_resource
+def _db_conn():
+    # one shared connection (and one schema check) for all sessions and reruns
+    init_db()
+    return get_conn()
+
+_db_conn()
+
+REVIEW_CAP = 800  # rows shown in the review list
+
+# Cached reads. sqlite3.Row doesn't pickle, so rows are returned as dicts.
+# `version` is db.data_version(): any write (from either page) changes the key.
+# The dataset list only changes on ingest, so it keys on db.catalog_version().
+@st.cache_data(show_spinner=False, max_entries=8)
+def _get_datasets(version):
+    return [dict(r) for r in get_datasets()]
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _count_images(version, dataset_id, decision_filter, search_text):
+    return count_images(dataset_id, decision_filter, search_text)
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _q_images(version, dataset_id, decision_filter, search_text, order_by, offset):
+    # the row at offset plus its Prev/Next neighbours from one LIMIT 3 query;
+    # returns (rows, index of the offset row in rows)
+    start = max(0, offset - 1)
+    rows = fetch_images(dataset_id, decision_filter, search_text, order_by, 3, start)
+    return [dict(r) for r in rows], offset - start
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _get_marked(version, dataset_id, decision):
+    return [dict(r) for r in get_marked(dataset_id, decision, limit=REVIEW_CAP)]
+
+# Raw file bytes keyed on mtime, so reruns (Prev/Next, button clicks) skip the disk
+# read. Kept small: full-resolution originals, only neighbours get revisited.
+@st.cache_data(show_spinner=False, max_entries=32)
+def _load_image_bytes(path, mtime):
+    with open(path, "rb") as f:
+        return f.read()
+
+@st.cache_resource
+def _prefetch_pool():
+    # shared across reruns; a module-level pool would be re-created on every rerun
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="img-prefetch")
+
+def _prefetch_image(path):
+    try:
+        _load_image_bytes(path, os.path.getmtime(path))
+    except OSError:
+        pass  # missing/unreadable; the viewer reports it when we get there
+
+def _badge(decision):
+    return "✅ keep" if decision == "keep" else "🗑️ discard" if decision == "discard" else "🤔 unsure"
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _review_table_html(version, dataset_id, decision, root_dir):
+    # Static HTML instead of st.dataframe: no grid component to mount and no
+    # dataframe to serialize on reruns that don't touch decisions.
+    import html
+    body = "".join(
+        f"<tr><td>{html.escape(os.path.join(root_dir, r['image_path']))}</td>"
+        f"<td style='white-space:nowrap'>{_badge(r['decision'])}</td></tr>"
+        for r in _get_marked(version, dataset_id, decision)
+    )
+    return (
+        "<div style='max-height:420px;overflow:auto;font-size:0.8rem'>"
+        "<table style='width:100%'>"
+        "<thead><tr><th>File (absolute path)</th><th>Decision</th></tr></thead>"
+        f"<tbody>{body}</tbody></table></div>"
+    )
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _review_options(version, dataset_id, decision, root_dir):
+    # Dropdown labels + label -> rel_path, rebuilt only when decisions change
+    labels = []
+    rel_by_label = {}
+    for r in _get_marked(version, dataset_id, decision):
+        abs_p = os.path.join(root_dir, r["image_path"])
+        # Dropdown label – short but unique: emoji + tail of path
+        tail = os.path.basename(r["image_path"])
+        label = f"{_badge(r['decision'])} · …{abs_p[-80:] if len(abs_p)>80 else abs_p} ({tail})"
+        labels.append(label)
+        rel_by_label.setdefault(label, r["image_path"])
+    return labels, rel_by_label
+
+def _clear_decision_caches():
+    # entries keyed on the old version can never hit again; drop them
+    _count_images.clear()
+    _q_images.clear()
+    _get_marked.clear()
+    _review_table_html.clear()
+    _review_options.clear()
 
 # Tighten global padding & remove default header/footer space
 st.markdown("""
@@ -49,7 +146,7 @@ if "_jump" in st.session_state:
 st.sidebar.title("DatasetCleaner")
 
 # Dataset picker
-datasets = get_datasets()
+datasets = _get_datasets(catalog_version())
 if not datasets:
     st.sidebar.info("No datasets yet. Use **Ingest new CSV** below.")
     ds = None
@@ -91,38 +188,29 @@ if root_dir:
 
 # Export decisions
 with st.sidebar.expander("Export decisions"):
+    import csv
     import io
-    import pandas as pd
     from db import get_export_rows
 
+    EXPORT_COLUMNS = [
+        "dataset_name", "root_dir", "image_name", "image_path", "abs_path",
+        "decision", "note", "updated_at", "metadata_json",
+    ]
+
     include_unmarked = st.checkbox("Include unmarked", value=False, key="exp_inc_unmarked")
     if st.button("Prepare CSV", key="exp_prep"):
         if dataset_id is None:
             st.info("Select a dataset first.")
         else:
-            rows = get_export_rows(dataset_id, include_unmarked=include_unmarked)
-            if not rows:
+            # cursor rows are already in column order; csv.writer consumes them directly
+            buf = io.StringIO()
+            w = csv.writer(buf)
+            w.writerow(EXPORT_COLUMNS)
+            header_end = buf.tell()
+            w.writerows(get_export_rows(dataset_id, include_unmarked=include_unmarked))
+            if buf.tell() == header_end:
                 st.info("Nothing to export.")
             else:
-                data = []
-                for r in rows:
-                    abs_path = os.path.join(r["root_dir"], r["image_path"])
-                    data.append(
-                        {
-                            "dataset_name": r["dataset_name"],
-                            "root_dir": r["root_dir"],
-                            "image_name": r["image_name"],
-                            "image_path": r["image_path"],  # relative
-                            "abs_path": abs_path,           # absolute
-                            "decision": r["decision"] or "",
-                            "note": r["note"] or "",
-                            "updated_at": r["updated_at"] or "",
-                            "metadata_json": r["metadata_json"],
-                        }
-                    )
-                df_export = pd.DataFrame(data)
-                buf = io.StringIO()
-                df_export.to_csv(buf, index=False)
                 st.download_button(
                     "⬇️ Download CSV",
                     data=buf.getvalue().encode("utf-8"),
@@ -142,20 +230,29 @@ with st.sidebar.expander("Ingest new CSV"):
         else:
             try:
                 ingest_cli(ds_name, root_dir_in, csv_path)
+                _get_datasets.clear()
+                _clear_decision_caches()
                 st.success("Ingested. Click refresh.")
             except SystemExit:
                 st.error("Ingestion failed. Check console/logs.")
 
 
 with st.sidebar.expander("Import decisions (CSV)"):
-    import pandas as pd
+    import csv
+    import io
     uploaded = st.file_uploader("Choose CSV exported from DatasetCleaner", type=["csv"], key="imp_csv")
     prefer_newer = st.checkbox("Only overwrite if CSV is newer (recommended)", value=True, key="imp_newer")
     if uploaded is not None and dataset_id is not None:
-        df = pd.read_csv(uploaded)
         if st.button("Import decisions", key="imp_go"):
             from db import bulk_import_decisions_from_rows
-            stats = bulk_import_decisions_from_rows(dataset_id, df.to_dict("records"), root_dir, prefer_newer=prefer_newer)
+            # stream rows to the importer; utf-8-sig tolerates an Excel BOM
+            uploaded.seek(0)
+            text = io.TextIOWrapper(uploaded, encoding="utf-8-sig", newline="")
+            try:
+                stats = bulk_import_decisions_from_rows(dataset_id, csv.DictReader(text), root_dir, prefer_newer=prefer_newer)
+            finally:
+                text.detach()  # leave the UploadedFile open for Streamlit
+            _clear_decision_caches()
             st.success(f"Upserted: {stats['upserted']} | Cleared: {stats['cleared']} | "
                        f"Skipped missing: {stats['skipped_missing']} | Skipped older: {stats['skipped_older']} | "
                        f"Invalid: {stats['invalid_decision']}")
@@ -163,9 +260,8 @@ with st.sidebar.expander("Import decisions (CSV)"):
 
 
 if st.sidebar.button("🔄 Refresh", key="refresh_btn"):
-    # st.cache_data.clear()
-    # st.cache_resource.clear()
-    pass  # a button press already causes a rerun
+    # picks up changes made outside this process (e.g. the ingest CLI)
+    st.cache_data.clear()
 
 
 # -------- Main body: center viewer + right review list --------
@@ -177,15 +273,11 @@ st.session_state.setdefault("offset", 0)
 st.session_state.setdefault("order_by", "image_path")
 order_by = st.session_state["order_by"]
 
-# Query one record for the viewer
-rows, total = query_images(
-    dataset_id=dataset_id,
-    decision_filter=st.session_state["decision_filter"],
-    search_text=st.session_state["search"].strip(),
-    order_by=order_by,
-    limit=1,
-    offset=st.session_state["offset"],
-)
+decision_filter = st.session_state["decision_filter"]
+search_text = st.session_state["search"].strip()
+
+# Count once per rerun, then fetch just the row at the current offset
+total = _count_images(data_version(), dataset_id, decision_filter, search_text)
 
 if total == 0:
     st.warning("No results. Try different filter/search.")
@@ -194,16 +286,17 @@ if total == 0:
 # Clamp offset if filters changed
 if st.session_state["offset"] >= total:
     st.session_state["offset"] = max(0, total - 1)
-    rows, total = query_images(
-        dataset_id,
-        st.session_state["decision_filter"],
-        st.session_state["search"].strip(),
-        order_by,
-        1,
-        st.session_state["offset"],
-    )
 
-row = rows[0]
+rows, cur_idx = _q_images(
+    data_version(),
+    dataset_id,
+    decision_filter,
+    search_text,
+    order_by,
+    st.session_state["offset"],
+)
+
+row = rows[cur_idx]
 abs_path = os.path.join(root_dir, row["image_path"])
 
 # Layout columns: big center (image + info) and slim right (review list)
@@ -215,10 +308,15 @@ with center:
 
     # Image
     if os.path.isfile(abs_path):
-        st.image(abs_path, use_column_width=True)
+        st.image(_load_image_bytes(abs_path, os.path.getmtime(abs_path)), use_column_width=True)
     else:
         st.error(f"File not found:\n{abs_path}")
 
+    # Warm the byte cache for Prev/Next while the user looks at this one
+    # (neighbours came with this row's query; Next first, it's the usual click)
+    for nb_row in rows[cur_idx + 1:] + rows[:cur_idx]:
+        _prefetch_pool().submit(_prefetch_image, os.path.join(root_dir, nb_row["image_path"]))
+
     # Name | Metadata | Decision
     c_name, c_meta, c_dec = st.columns([1.2, 2.5, 1])
     with c_name:
@@ -227,7 +325,7 @@ with center:
     with c_meta:
         st.markdown("**Metadata**")
         try:
-            meta = json.loads(row["metadata_json"])
+            meta = json_loads(row["metadata_json"])
         except Exception:
             meta = {"_error": "Invalid JSON"}
         st.json(meta, expanded=True)
@@ -236,19 +334,24 @@ with center:
         st.code(row["decision"] or "—", language="text")
 
     # Decision buttons row
+    def _decide(decision, note):
+        set_decision(row["id"], decision, note)
+        _clear_decision_caches()
+        # Mark-and-advance: if the image still matches the filter, step past it;
+        # otherwise it drops out and the next one slides into this offset.
+        if decision is not None and decision_filter in ("all", decision):
+            st.session_state["offset"] = min(total - 1, st.session_state["offset"] + 1)
+        st.rerun()
+
     b1, b2, b3, b4 = st.columns([1, 1, 1, 1])
     if b1.button("✅ Keep", use_container_width=True, key=f"keep_{row['id']}"):
-        set_decision(row["id"], "keep", (row["note"] or None))
-        st.rerun()
+        _decide("keep", (row["note"] or None))
     if b2.button("🗑️ Discard", use_container_width=True, key=f"discard_{row['id']}"):
-        set_decision(row["id"], "discard", (row["note"] or None))
-        st.rerun()
+        _decide("discard", (row["note"] or None))
     if b3.button("🤔 Unsure", use_container_width=True, key=f"unsure_{row['id']}"):
-        set_decision(row["id"], "unsure", (row["note"] or None))
-        st.rerun()
+        _decide("unsure", (row["note"] or None))
     if b4.button("♻️ Clear", use_container_width=True, key=f"clear_{row['id']}"):
-        set_decision(row["id"], None, None)
-        st.rerun()
+        _decide(None, None)  # stays on this image
 
     # Pager + absolute path
     pg1, pg2, pg3 = st.columns([1, 1, 3])
@@ -274,56 +377,26 @@ with right:
         label_visibility="collapsed",
     )
     dec = None if choice == "All marked" else choice.lower()
-    marked = get_marked(dataset_id, dec)
+    marked = _get_marked(data_version(), dataset_id, dec)
 
     if not marked:
         st.info("Nothing here yet.")
     else:
-        # Build a neat table for display + a map for selection
-        table_rows = []
-        select_options = []   # (label, rel_path)
-        for r in marked[:800]:  # cap for speed
-            abs_p = os.path.join(root_dir, r["image_path"])
-            # Emoji badge for readability
-            decision = r["decision"]
-            badge = "✅ keep" if decision == "keep" else "🗑️ discard" if decision == "discard" else "🤔 unsure"
-            table_rows.append(
-                {
-                    "File (absolute path)": abs_p,
-                    "Decision": badge,
-                }
-            )
-            # Dropdown label – short but unique: emoji + tail of path
-            tail = os.path.basename(r["image_path"])
-            label = f"{badge} · …{abs_p[-80:] if len(abs_p)>80 else abs_p} ({tail})"
-            select_options.append((label, r["image_path"]))
+        labels, rel_by_label = _review_options(data_version(), dataset_id, dec, root_dir)
 
         # Show as a compact table
-        import pandas as pd
-        df_view = pd.DataFrame(table_rows)
-        st.dataframe(
-            df_view,
-            use_container_width=True,
-            height=420,
-            hide_index=True,
-        )
+        st.markdown(_review_table_html(data_version(), dataset_id, dec, root_dir), unsafe_allow_html=True)
 
         # Row picker + "View"
-        labels = [lbl for (lbl, _rel) in select_options]
         picked = st.selectbox(
             "Pick an item to view", labels, index=0,
             label_visibility="collapsed", key="review_pick"
         )
         if st.button("View selected", key="review_view_btn"):
-            # Find rel_path for the picked label
-            for lbl, rel in select_options:
-                if lbl == picked:
-                    st.session_state._jump = {
-                        "search": rel,               # search by relative path (unique)
-                        "decision_filter": "all",    # ensure it is visible
-                        "order_by": "image_path",
-                        "offset": 0,
-                    }
-                    st.rerun()
-                    break
-
+            st.session_state._jump = {
+                "search": rel_by_label[picked],  # search by relative path (unique)
+                "decision_filter": "all",        # ensure it is visible
+                "order_by": "image_path",
+                "offset": 0,
+            }
+            st.rerun()
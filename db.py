@@ -1,72 +1,332 @@
 import json
 import os
 import sqlite3
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import groupby
 from typing import List, Optional, Tuple, Dict, Any, Iterable
 
+try:  # optional fast path; output is the same compact UTF-8 JSON either way
+    import orjson
+
+    def json_dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+    json_loads = orjson.loads
+except ImportError:
+    def json_dumps(obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    json_loads = json.loads
+
 DB_PATH = os.environ.get("IMGQA_DB_PATH", "image_qa.sqlite")
+# WAL + NORMAL: a commit is not fsynced, so each decision click skips a disk
+# flush. The database never corrupts and committed decisions survive an app
+# crash; an OS crash or power loss can roll back the last few. Fine for a local
+# labeling tool; set IMGQA_SYNCHRONOUS=FULL to fsync every commit instead.
+DB_SYNCHRONOUS = os.environ.get("IMGQA_SYNCHRONOUS", "NORMAL").upper()
+if DB_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    DB_SYNCHRONOUS = "NORMAL"
 VALID_DECISIONS = {"keep", "discard", "unsure"}
 
-def get_conn():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Set by init_db() once images_fts exists; _viewer_where falls back to LIKE otherwise.
+_FTS_ENABLED = False
+# Set by init_db() once images.archetype / images.location_category exist.
+_ARCH_CAT_COLUMNS = False
+# Set by init_db() once the trigger-maintained image_arch_cat table exists.
+_ARCH_CAT_TABLE = False
+
+_CONN: Optional[sqlite3.Connection] = None
+_CONN_LOCK = threading.Lock()
+# Streamlit runs each session's script on its own thread, all sharing _CONN.
+# Transactions are per connection, so writers take turns: otherwise another
+# thread's statements would land inside (and roll back with) our BEGIN.
+_WRITE_LOCK = threading.RLock()
+# Bumped on every write through this module; UI caches include it in their keys
+# so a change made on one page is not served stale on another.
+_DATA_VERSION = 0
+# Bumped only by writes to datasets/images (ingest), not by decisions: keys the
+# caches of things decisions can't change, like the dataset list.
+_CATALOG_VERSION = 0
+
+def get_conn() -> sqlite3.Connection:
+    """
+    Returns the process-wide connection, opening it on first use.
+    Streamlit reruns the script on every click, so reconnecting (and re-applying
+    pragmas) per helper call would dominate the tiny viewer queries.
+    Autocommit mode: multi-statement writers open their own transaction.
+    """
+    global _CONN
+    if _CONN is None:
+        with _CONN_LOCK:
+            if _CONN is None:
+                conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+                conn.row_factory = sqlite3.Row
+                conn.executescript(
+                    f"""
+                    PRAGMA journal_mode=WAL;
+                    PRAGMA synchronous={DB_SYNCHRONOUS};
+                    PRAGMA temp_store=MEMORY;
+                    PRAGMA mmap_size=268435456;
+                    """
+                )
+                _CONN = conn
+    return _CONN
+
+def data_version() -> int:
+    return _DATA_VERSION
+
+def _bump_data_version():
+    global _DATA_VERSION
+    _DATA_VERSION += 1
+
+def catalog_version() -> int:
+    return _CATALOG_VERSION
+
+def _bump_catalog_version():
+    global _CATALOG_VERSION
+    _CATALOG_VERSION += 1
+
+@contextmanager
+def _write_txn(conn: sqlite3.Connection, catalog: bool = False):
+    """
+    One explicit write transaction on the autocommit connection.
+    IMMEDIATE takes the write lock up front instead of failing mid-batch.
+    catalog=True marks a datasets/images write (also bumps catalog_version).
+    """
+    with _WRITE_LOCK:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        _bump_data_version()
+        if catalog:
+            _bump_catalog_version()
 
 def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.executescript(
-        """
-        PRAGMA journal_mode=WAL;
+    # executescript COMMITs first; keep it from ending another thread's transaction
+    with _WRITE_LOCK:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS datasets (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                root_dir TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS images (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                dataset_id INTEGER NOT NULL,
+                image_name TEXT NOT NULL,
+                image_path TEXT NOT NULL,  -- relative to dataset root
+                metadata_json TEXT NOT NULL,
+                UNIQUE(dataset_id, image_path),
+                FOREIGN KEY(dataset_id) REFERENCES datasets(id) ON DELETE CASCADE
+            );
+
+            CREATE TABLE IF NOT EXISTS decisions (
+                image_id INTEGER PRIMARY KEY,
+                decision TEXT CHECK(decision IN ('keep','discard','unsure')) NOT NULL,
+                note TEXT,
+                updated_at TEXT NOT NULL,
+                FOREIGN KEY(image_id) REFERENCES images(id) ON DELETE CASCADE
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_images_dataset ON images(dataset_id);
+            -- (dataset_id, image_path) is already covered by the UNIQUE constraint's index
+            CREATE INDEX IF NOT EXISTS idx_images_ds_name ON images(dataset_id, image_name);
+            CREATE INDEX IF NOT EXISTS idx_decisions_decision ON decisions(decision);
+            CREATE INDEX IF NOT EXISTS idx_decisions_updated_at ON decisions(updated_at DESC);
+            DROP INDEX IF EXISTS idx_images_name;
+            DROP INDEX IF EXISTS idx_images_path;
+            """
+        )
+        conn.commit()
+        _init_arch_cat_columns(conn)
+        _init_arch_cat_table(conn)
+        _init_fts(conn)
 
-        CREATE TABLE IF NOT EXISTS datasets (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            root_dir TEXT NOT NULL,
-            created_at TEXT NOT NULL
-        );
+def analyze():
+    """
+    Refresh the planner's statistics (sqlite_stat1) after a bulk ingest, so
+    per-category lookups keep choosing idx_images_ds_arch_cat_path and filtered
+    views can start from whichever of images/decisions is smaller.
+    """
+    with _WRITE_LOCK:
+        get_conn().execute("ANALYZE")
 
-        CREATE TABLE IF NOT EXISTS images (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+_ARCH_EXPR = "COALESCE(json_extract(metadata_json, '$.unique_context_archetype'), json_extract(metadata_json, '$.gt_context_archetype'), json_extract(metadata_json, '$.gt_context_archetypes'))"
+_CAT_EXPR = "COALESCE(json_extract(metadata_json, '$.gt_location_category'), json_extract(metadata_json, '$.location_category'), json_extract(metadata_json, '$.gt_location'))"
+
+def _init_arch_cat_columns(conn: sqlite3.Connection):
+    """
+    Generated columns for the Explorer's archetype/category keys, plus an index,
+    so its queries stop re-parsing metadata_json for every row.
+    SQLite's ALTER TABLE can only add VIRTUAL generated columns; the index
+    stores the computed values, which is what the lookups read.
+    Needs SQLite >= 3.31; on older builds the JSON expressions are used directly.
+    """
+    global _ARCH_CAT_COLUMNS
+    cols = {r["name"] for r in conn.execute("PRAGMA table_xinfo(images)")}
+    try:
+        if "archetype" not in cols:
+            conn.execute(f"ALTER TABLE images ADD COLUMN archetype TEXT GENERATED ALWAYS AS ({_ARCH_EXPR}) VIRTUAL")
+        if "location_category" not in cols:
+            conn.execute(f"ALTER TABLE images ADD COLUMN location_category TEXT GENERATED ALWAYS AS ({_CAT_EXPR}) VIRTUAL")
+        # image_path last: a category's page comes out of the index already in
+        # ORDER BY image_path order, so LIMIT/OFFSET stop early instead of sorting
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_images_ds_arch_cat_path ON images(dataset_id, archetype, location_category, image_path)")
+        conn.execute("DROP INDEX IF EXISTS idx_images_ds_arch_cat")
+    except sqlite3.OperationalError:
+        _ARCH_CAT_COLUMNS = False
+        return
+    _ARCH_CAT_COLUMNS = True
+
+def _init_arch_cat_table(conn: sqlite3.Connection):
+    """
+    Per-dataset (archetype, category) -> image count, kept in sync with `images`
+    by triggers, so the Explorer's tree reads a handful of rows instead of
+    grouping every image of the dataset. Needs the generated columns above.
+    """
+    global _ARCH_CAT_TABLE
+    if not _ARCH_CAT_COLUMNS:
+        _ARCH_CAT_TABLE = False
+        return
+    existed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='image_arch_cat'"
+    ).fetchone() is not None
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS image_arch_cat (
             dataset_id INTEGER NOT NULL,
-            image_name TEXT NOT NULL,
-            image_path TEXT NOT NULL,  -- relative to dataset root
-            metadata_json TEXT NOT NULL,
-            UNIQUE(dataset_id, image_path),
-            FOREIGN KEY(dataset_id) REFERENCES datasets(id) ON DELETE CASCADE
-        );
-
-        CREATE TABLE IF NOT EXISTS decisions (
-            image_id INTEGER PRIMARY KEY,
-            decision TEXT CHECK(decision IN ('keep','discard','unsure')) NOT NULL,
-            note TEXT,
-            updated_at TEXT NOT NULL,
-            FOREIGN KEY(image_id) REFERENCES images(id) ON DELETE CASCADE
-        );
-
-        CREATE INDEX IF NOT EXISTS idx_images_dataset ON images(dataset_id);
-        CREATE INDEX IF NOT EXISTS idx_images_name ON images(image_name);
-        CREATE INDEX IF NOT EXISTS idx_images_path ON images(image_path);
+            archetype TEXT NOT NULL,
+            location_category TEXT NOT NULL,
+            n_images INTEGER NOT NULL,
+            PRIMARY KEY(dataset_id, archetype, location_category)
+        ) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS image_arch_cat_ai AFTER INSERT ON images
+        WHEN new.archetype IS NOT NULL AND new.location_category IS NOT NULL BEGIN
+            INSERT INTO image_arch_cat(dataset_id, archetype, location_category, n_images)
+            VALUES (new.dataset_id, new.archetype, new.location_category, 1)
+            ON CONFLICT(dataset_id, archetype, location_category) DO UPDATE SET n_images = n_images + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS image_arch_cat_ad AFTER DELETE ON images
+        WHEN old.archetype IS NOT NULL AND old.location_category IS NOT NULL BEGIN
+            UPDATE image_arch_cat SET n_images = n_images - 1
+            WHERE dataset_id=old.dataset_id AND archetype=old.archetype AND location_category=old.location_category;
+            DELETE FROM image_arch_cat
+            WHERE dataset_id=old.dataset_id AND archetype=old.archetype AND location_category=old.location_category
+              AND n_images <= 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS image_arch_cat_au AFTER UPDATE OF dataset_id, metadata_json ON images BEGIN
+            UPDATE image_arch_cat SET n_images = n_images - 1
+            WHERE dataset_id=old.dataset_id AND archetype=old.archetype AND location_category=old.location_category;
+            DELETE FROM image_arch_cat
+            WHERE dataset_id=old.dataset_id AND archetype=old.archetype AND location_category=old.location_category
+              AND n_images <= 0;
+            INSERT INTO image_arch_cat(dataset_id, archetype, location_category, n_images)
+            SELECT new.dataset_id, new.archetype, new.location_category, 1
+            WHERE new.archetype IS NOT NULL AND new.location_category IS NOT NULL
+            ON CONFLICT(dataset_id, archetype, location_category) DO UPDATE SET n_images = n_images + 1;
+        END;
         """
     )
-    conn.commit()
+    if not existed:
+        # count rows ingested before the table existed
+        conn.execute(
+            """
+            INSERT INTO image_arch_cat(dataset_id, archetype, location_category, n_images)
+            SELECT dataset_id, archetype, location_category, COUNT(*)
+            FROM images
+            WHERE archetype IS NOT NULL AND location_category IS NOT NULL
+            GROUP BY dataset_id, archetype, location_category
+            """
+        )
+    _ARCH_CAT_TABLE = True
+
+def _init_fts(conn: sqlite3.Connection):
+    """
+    Trigram index over image_name, image_path and metadata_json, kept in sync
+    with `images` by triggers. Trigrams give the search box's substring (LIKE
+    '%...%') semantics from the index, for queries of 3+ characters.
+    Skipped silently if SQLite lacks FTS5 or the trigram tokenizer (< 3.34).
+    """
+    global _FTS_ENABLED
+    row = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type='table' AND name='images_fts'"
+    ).fetchone()
+    existed = row is not None
+    if existed and "trigram" not in row["sql"]:
+        # older word-token index: token-prefix matches only; rebuild it
+        conn.execute("DROP TABLE images_fts")
+        existed = False
+    try:
+        conn.executescript(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5(
+                image_name, image_path, metadata_json,
+                content='images', content_rowid='id',
+                tokenize='trigram'
+            );
+
+            CREATE TRIGGER IF NOT EXISTS images_fts_ai AFTER INSERT ON images BEGIN
+                INSERT INTO images_fts(rowid, image_name, image_path, metadata_json)
+                VALUES (new.id, new.image_name, new.image_path, new.metadata_json);
+            END;
+            CREATE TRIGGER IF NOT EXISTS images_fts_ad AFTER DELETE ON images BEGIN
+                INSERT INTO images_fts(images_fts, rowid, image_name, image_path, metadata_json)
+                VALUES ('delete', old.id, old.image_name, old.image_path, old.metadata_json);
+            END;
+            CREATE TRIGGER IF NOT EXISTS images_fts_au AFTER UPDATE ON images BEGIN
+                INSERT INTO images_fts(images_fts, rowid, image_name, image_path, metadata_json)
+                VALUES ('delete', old.id, old.image_name, old.image_path, old.metadata_json);
+                INSERT INTO images_fts(rowid, image_name, image_path, metadata_json)
+                VALUES (new.id, new.image_name, new.image_path, new.metadata_json);
+            END;
+            """
+        )
+    except sqlite3.OperationalError:
+        _FTS_ENABLED = False
+        return
+    if not existed:
+        # index rows ingested before the FTS table existed
+        conn.execute("INSERT INTO images_fts(images_fts) VALUES('rebuild')")
+    _FTS_ENABLED = True
+
+def _fts_query(search_text: str) -> Optional[str]:
+    """
+    Turns free text into a trigram FTS5 phrase, which matches it as a
+    case-insensitive substring, e.g. "n18.j" -> '"n18.j"'. Returns None below
+    3 characters (no whole trigram to look up), so the caller uses LIKE.
+    """
+    if len(search_text) < 3:
+        return None
+    return '"' + search_text.replace('"', '""') + '"'
 
 def upsert_dataset(name: str, root_dir: str) -> int:
     conn = get_conn()
-    cur = conn.cursor()
     now = datetime.utcnow().isoformat()
-    cur.execute("SELECT id FROM datasets WHERE name = ?", (name,))
-    row = cur.fetchone()
-    if row:
-        cur.execute("UPDATE datasets SET root_dir = ? WHERE id = ?", (root_dir, row["id"]))
-        conn.commit()
-        return row["id"]
-    cur.execute(
-        "INSERT INTO datasets(name, root_dir, created_at) VALUES(?,?,?)",
-        (name, root_dir, now),
-    )
-    conn.commit()
-    return cur.lastrowid
+    with _write_txn(conn, catalog=True):
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM datasets WHERE name = ?", (name,))
+        row = cur.fetchone()
+        if row:
+            cur.execute("UPDATE datasets SET root_dir = ? WHERE id = ?", (root_dir, row["id"]))
+            return row["id"]
+        cur.execute(
+            "INSERT INTO datasets(name, root_dir, created_at) VALUES(?,?,?)",
+            (name, root_dir, now),
+        )
+        return cur.lastrowid
 
 def get_datasets() -> List[sqlite3.Row]:
     conn = get_conn()
@@ -81,55 +341,56 @@ def insert_images(dataset_id: int, rows: List[Tuple[str, str, Dict[str, Any]]])
     rows: list of (image_name, image_path, metadata_dict)
     Returns number of inserted rows (skips duplicates).
     """
+    payload = [
+        (dataset_id, name, path, json_dumps(meta))
+        for name, path, meta in rows
+    ]
     conn = get_conn()
-    cur = conn.cursor()
-    inserted = 0
-    for name, path, meta in rows:
-        try:
-            cur.execute(
-                "INSERT OR IGNORE INTO images(dataset_id, image_name, image_path, metadata_json) VALUES (?,?,?,?)",
-                (dataset_id, name, path, json.dumps(meta, ensure_ascii=False)),
-            )
-            if cur.rowcount > 0:
-                inserted += 1
-        except sqlite3.IntegrityError:
-            pass
-    conn.commit()
-    return inserted
+    with _write_txn(conn, catalog=True):
+        cur = conn.executemany(
+            "INSERT OR IGNORE INTO images(dataset_id, image_name, image_path, metadata_json) VALUES (?,?,?,?)",
+            payload,
+        )
+    # executemany sums rowcount; ignored duplicates don't count
+    return max(cur.rowcount, 0)
+
+_CLEAR_DECISION_SQL = "DELETE FROM decisions WHERE image_id=?"
+# rows per executemany flush in bulk_import_decisions_from_rows
+_IMPORT_FLUSH_ROWS = 10_000
+_UPSERT_DECISION_SQL = """
+    INSERT INTO decisions(image_id, decision, note, updated_at)
+    VALUES(?,?,?,?)
+    ON CONFLICT(image_id) DO UPDATE SET
+      decision=excluded.decision,
+      note=COALESCE(excluded.note, decisions.note),
+      updated_at=excluded.updated_at
+"""
 
 def set_decision(image_id: int, decision: Optional[str], note: Optional[str] = None):
     """
     decision is 'keep' | 'discard' | 'unsure'
     If decision is None, clears the decision row.
+    Written through, not buffered: under WAL + synchronous=NORMAL the commit
+    costs no fsync, and every count/filter/export sees it without an overlay.
+    Many at once: set_decisions_bulk.
     """
     conn = get_conn()
-    cur = conn.cursor()
-    if decision is None:
-        cur.execute("DELETE FROM decisions WHERE image_id = ?", (image_id,))
-    else:
-        now = datetime.utcnow().isoformat()
-        cur.execute(
-            """
-            INSERT INTO decisions(image_id, decision, note, updated_at)
-            VALUES(?,?,?,?)
-            ON CONFLICT(image_id) DO UPDATE SET
-              decision=excluded.decision,
-              note=COALESCE(excluded.note, decisions.note),
-              updated_at=excluded.updated_at
-            """,
-            (image_id, decision, note, now),
-        )
-    conn.commit()
+    with _WRITE_LOCK:
+        cur = conn.cursor()
+        if decision is None:
+            cur.execute(_CLEAR_DECISION_SQL, (image_id,))
+        else:
+            now = datetime.utcnow().isoformat()
+            cur.execute(_UPSERT_DECISION_SQL, (image_id, decision, note, now))
+        conn.commit()
+        _bump_data_version()
 
-def query_images(
+def _viewer_where(
     dataset_id: int,
-    decision_filter: str = "unmarked",  # unmarked|keep|discard|unsure|all
-    search_text: str = "",
-    order_by: str = "image_name",       # image_name|image_path|random
-    limit: int = 1,
-    offset: int = 0,
-) -> Tuple[List[sqlite3.Row], int]:
-    conn = get_conn()
+    decision_filter: str,
+    search_text: str,
+) -> Tuple[str, List[Any]]:
+    """WHERE clause + params shared by count_images and fetch_images."""
     params = [dataset_id]
     where = ["i.dataset_id = ?"]
 
@@ -140,22 +401,45 @@ def query_images(
         where.append("d.decision = ?")
         params.append(decision_filter)
 
-    # Search text across name, path, and metadata_json
-    if search_text:
+    # Search text across name, path, and metadata_json (substring match)
+    fts_q = _fts_query(search_text) if (search_text and _FTS_ENABLED) else None
+    if fts_q:
+        where.append("i.id IN (SELECT rowid FROM images_fts WHERE images_fts MATCH ?)")
+        params.append(fts_q)
+    elif search_text:
         st = f"%{search_text.lower()}%"
         where.append("(LOWER(i.image_name) LIKE ? OR LOWER(i.image_path) LIKE ? OR LOWER(i.metadata_json) LIKE ?)")
         params.extend([st, st, st])
 
-    where_sql = " AND ".join(where)
+    return " AND ".join(where), params
 
-    # Count
+def count_images(
+    dataset_id: int,
+    decision_filter: str = "unmarked",  # unmarked|keep|discard|unsure|all
+    search_text: str = "",
+) -> int:
+    conn = get_conn()
+    where_sql, params = _viewer_where(dataset_id, decision_filter, search_text)
+    # the decisions join only matters when the filter looks at it
+    join_sql = "" if decision_filter == "all" else "LEFT JOIN decisions d ON d.image_id = i.id"
     count_sql = f"""
         SELECT COUNT(*) AS cnt
         FROM images i
-        LEFT JOIN decisions d ON d.image_id = i.id
+        {join_sql}
         WHERE {where_sql}
     """
-    total = conn.execute(count_sql, params).fetchone()["cnt"]
+    return conn.execute(count_sql, params).fetchone()["cnt"]
+
+def fetch_images(
+    dataset_id: int,
+    decision_filter: str = "unmarked",  # unmarked|keep|discard|unsure|all
+    search_text: str = "",
+    order_by: str = "image_name",       # image_name|image_path|random
+    limit: int = 1,
+    offset: int = 0,
+) -> List[sqlite3.Row]:
+    conn = get_conn()
+    where_sql, params = _viewer_where(dataset_id, decision_filter, search_text)
 
     # Order
     if order_by == "random":
@@ -173,10 +457,41 @@ def query_images(
         {order_sql}
         LIMIT ? OFFSET ?
     """
-    rs = conn.execute(sql, params + [limit, offset]).fetchall()
+    return conn.execute(sql, params + [limit, offset]).fetchall()
+
+def set_decisions_bulk(image_ids: Iterable[int], decision: Optional[str], note: Optional[str] = None):
+    """
+    set_decision for many images in one transaction (one executemany).
+    decision=None clears them.
+    """
+    if decision is None:
+        payload = [(image_id,) for image_id in image_ids]
+        sql = _CLEAR_DECISION_SQL
+    else:
+        now = datetime.utcnow().isoformat()
+        payload = [(image_id, decision, note, now) for image_id in image_ids]
+        sql = _UPSERT_DECISION_SQL
+    if not payload:
+        return
+    conn = get_conn()
+    with _write_txn(conn):
+        conn.executemany(sql, payload)
+
+def query_images(
+    dataset_id: int,
+    decision_filter: str = "unmarked",  # unmarked|keep|discard|unsure|all
+    search_text: str = "",
+    order_by: str = "image_name",       # image_name|image_path|random
+    limit: int = 1,
+    offset: int = 0,
+) -> Tuple[List[sqlite3.Row], int]:
+    """(rows, total) in one call; the viewer uses count_images/fetch_images separately."""
+    total = count_images(dataset_id, decision_filter, search_text)
+    rs = fetch_images(dataset_id, decision_filter, search_text, order_by, limit, offset)
     return rs, total
 
-def get_marked(dataset_id: int, decision: Optional[str] = None) -> List[sqlite3.Row]:
+def get_marked(dataset_id: int, decision: Optional[str] = None, limit: int = 800) -> List[sqlite3.Row]:
+    """Most recently updated decisions first, capped at `limit` rows."""
     conn = get_conn()
     if decision:
         sql = """
@@ -184,84 +499,98 @@ def get_marked(dataset_id: int, decision: Optional[str] = None) -> List[sqlite3.
           FROM images i JOIN decisions d ON d.image_id = i.id
           WHERE i.dataset_id = ? AND d.decision = ?
           ORDER BY d.updated_at DESC
+          LIMIT ?
         """
-        return conn.execute(sql, (dataset_id, decision)).fetchall()
+        return conn.execute(sql, (dataset_id, decision, limit)).fetchall()
     else:
         sql = """
           SELECT i.*, d.decision, d.note, d.updated_at
           FROM images i JOIN decisions d ON d.image_id = i.id
           WHERE i.dataset_id = ?
           ORDER BY d.updated_at DESC
+          LIMIT ?
         """
-        return conn.execute(sql, (dataset_id,)).fetchall()
+        return conn.execute(sql, (dataset_id, limit)).fetchall()
     
-def get_export_rows(dataset_id: int, include_unmarked: bool = False):
+def get_export_rows(dataset_id: int, include_unmarked: bool = False) -> Iterable[tuple]:
     """
-    Returns rows for CSV export:
+    Yields plain tuples for CSV export straight off the cursor (nothing is materialized),
+    in column order, ready for csv.writer.writerows:
     dataset_name, root_dir, image_name, image_path (relative), abs_path, decision, note, updated_at, metadata_json
-    If include_unmarked=True, includes images with no decision (decision=None).
+    abs_path is os.path.join(root_dir, image_path), as in the viewer (an absolute
+    image_path stays as is); missing decision/note/updated_at come back as ''.
+    If include_unmarked=True, includes images with no decision.
     """
-    conn = get_conn()
-    # Fetch dataset info for abs_path composition on the app side if you prefer;
-    # but returning root_dir here keeps app.py simpler.
-    sql = """
+    # Inner join drops unmarked images inside SQLite rather than in Python.
+    join = "LEFT JOIN decisions d" if include_unmarked else "JOIN decisions d"
+    sql = f"""
         SELECT
             ds.name AS dataset_name,
             ds.root_dir AS root_dir,
-            i.id AS image_id,
             i.image_name,
             i.image_path,
-            d.decision,
-            d.note,
-            d.updated_at,
+            COALESCE(d.decision, '') AS decision,
+            COALESCE(d.note, '') AS note,
+            COALESCE(d.updated_at, '') AS updated_at,
             i.metadata_json
         FROM images i
         JOIN datasets ds ON ds.id = i.dataset_id
-        LEFT JOIN decisions d ON d.image_id = i.id
+        {join} ON d.image_id = i.id
         WHERE i.dataset_id = ?
     """
-    rows = conn.execute(sql, (dataset_id,)).fetchall()
-    if not include_unmarked:
-        rows = [r for r in rows if r["decision"] is not None]
-    return rows
+    cur = _tuple_cursor()
+    join_path = os.path.join
+    for row in cur.execute(sql, (dataset_id,)):
+        yield row[:4] + (join_path(row[1], row[3]),) + row[4:]
 
 def _json_field_expr():
-    arch = "COALESCE(json_extract(metadata_json, '$.unique_context_archetype'), json_extract(metadata_json, '$.gt_context_archetype'), json_extract(metadata_json, '$.gt_context_archetypes'))"
-    cat  = "COALESCE(json_extract(metadata_json, '$.gt_location_category'), json_extract(metadata_json, '$.location_category'), json_extract(metadata_json, '$.gt_location'))"
-    return arch, cat
+    if _ARCH_CAT_COLUMNS:
+        return "archetype", "location_category"
+    return _ARCH_EXPR, _CAT_EXPR
 
 def get_archetype_tree(dataset_id: int):
     conn = get_conn()
     cur = conn.cursor()
+    if _ARCH_CAT_TABLE:
+        # maintained by triggers; one row per (archetype, category)
+        cur.execute("""
+            SELECT archetype, location_category
+            FROM image_arch_cat
+            WHERE dataset_id=?
+            ORDER BY archetype, location_category
+        """, (dataset_id,))
+        tree = {}
+        for a, c in cur:
+            tree.setdefault(a, []).append(c)
+        return tree
+
     arch_expr, cat_expr = _json_field_expr()
 
+    # one grouped pass over (archetype, category) pairs, bucketed here
     cur.execute(f"""
-        SELECT DISTINCT {arch_expr} AS arche
+        SELECT {arch_expr} AS arche, {cat_expr} AS cat
         FROM images
-        WHERE dataset_id=? AND {arch_expr} IS NOT NULL
-        ORDER BY arche
+        WHERE dataset_id=? AND {arch_expr} IS NOT NULL AND {cat_expr} IS NOT NULL
+        GROUP BY arche, cat
+        ORDER BY arche, cat
     """, (dataset_id,))
-    archetypes = [r[0] for r in cur.fetchall()]
 
     tree = {}
-    for a in archetypes:
-        cur.execute(f"""
-            SELECT DISTINCT {cat_expr} AS cat
-            FROM images
-            WHERE dataset_id=? AND {arch_expr}=? AND {cat_expr} IS NOT NULL
-            ORDER BY cat
-        """, (dataset_id, a))
-        tree[a] = [r[0] for r in cur.fetchall()]
-    conn.close()
+    for a, c in cur:
+        tree.setdefault(a, []).append(c)
     return tree
 
-def count_images_by_arch_cat(dataset_id: int, archetype: str, category: str, decision_filter: Optional[str] = None) -> int:
-    """
-    Returns count for (archetype, category) optionally filtered by decision:
-    decision_filter in {'keep','discard','unsure','unmarked'} or None/'all'
-    """
-    conn = get_conn()
-    cur = conn.cursor()
+# Explorer grid rows: plain tuples with attribute access, no per-row dict lookups
+ImageRow = namedtuple("ImageRow", "id image_name image_path decision note updated_at")
+_IMAGE_ROW_COLS = "i.id, i.image_name, i.image_path, d.decision, d.note, d.updated_at"
+
+def _arch_cat_base(
+    dataset_id: int,
+    archetype: str,
+    category: str,
+    decision_filter: Optional[str] = None,
+) -> Tuple[str, List[Any]]:
+    """FROM/WHERE clause + params shared by the (archetype, category) queries."""
     arch_expr, cat_expr = _json_field_expr()
 
     base = f"""
@@ -277,10 +606,19 @@ def count_images_by_arch_cat(dataset_id: int, archetype: str, category: str, dec
     elif decision_filter == "unmarked":
         base += " AND d.image_id IS NULL"
         # no param
+    return base, params
+
+def count_images_by_arch_cat(dataset_id: int, archetype: str, category: str, decision_filter: Optional[str] = None) -> int:
+    """
+    Returns count for (archetype, category) optionally filtered by decision:
+    decision_filter in {'keep','discard','unsure','unmarked'} or None/'all'
+    """
+    conn = get_conn()
+    cur = conn.cursor()
+    base, params = _arch_cat_base(dataset_id, archetype, category, decision_filter)
 
     cur.execute("SELECT COUNT(*) " + base, params)
     n = cur.fetchone()[0]
-    conn.close()
     return n
 
 def images_by_arch_cat(
@@ -291,38 +629,63 @@ def images_by_arch_cat(
     order_by: str = "image_path",
     limit: int = 60,
     offset: int = 0,
+    after: Optional[str] = None,
 ):
     """
-    Returns image rows (joined with decisions) for (archetype, category)
+    Returns ImageRow tuples (joined with decisions) for (archetype, category)
     with optional decision_filter as above.
+    after: keyset cursor, the last image_path of the previous page; the index
+    seeks straight to it instead of stepping over OFFSET rows. Needs
+    order_by='image_path' (unique per dataset, so the order is total).
     """
-    conn = get_conn()
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    arch_expr, cat_expr = _json_field_expr()
+    cur = _tuple_cursor()
+    base, params = _arch_cat_base(dataset_id, archetype, category, decision_filter)
 
-    base = f"""
-        FROM images i
-        LEFT JOIN decisions d ON d.image_id = i.id
-        WHERE i.dataset_id=? AND {arch_expr}=? AND {cat_expr}=?
-    """
-    params = [dataset_id, archetype, category]
+    order_sql = "i.image_path" if order_by == "image_path" else "i.image_name"
+    if after is not None:
+        if order_by != "image_path":
+            raise ValueError("after= requires order_by='image_path'")
+        base += " AND i.image_path > ?"
+        params.append(after)
 
-    if decision_filter in ("keep", "discard", "unsure"):
-        base += " AND d.decision = ?"
-        params.append(decision_filter)
-    elif decision_filter == "unmarked":
-        base += " AND d.image_id IS NULL"
+    cur.execute(
+        f"SELECT {_IMAGE_ROW_COLS} " + base + f" ORDER BY {order_sql} LIMIT ? OFFSET ?",
+        params + [limit, offset],
+    )
+    return list(map(ImageRow._make, cur))
+
+def page_images_by_arch_cat(
+    dataset_id: int,
+    archetype: str,
+    category: str,
+    decision_filter: Optional[str] = None,
+    order_by: str = "image_path",
+    limit: int = 60,
+    offset: int = 0,
+) -> Tuple[List[ImageRow], int]:
+    """
+    images_by_arch_cat + count_images_by_arch_cat in one statement:
+    COUNT(*) OVER() is computed over the whole filtered set before LIMIT applies.
+    Returns (rows, total). An offset past the end yields no rows, so the total
+    then comes from a separate count.
+    """
+    cur = _tuple_cursor()
+    base, params = _arch_cat_base(dataset_id, archetype, category, decision_filter)
 
     order_sql = "i.image_path" if order_by == "image_path" else "i.image_name"
 
     cur.execute(
-        "SELECT i.*, d.decision, d.note, d.updated_at " + base + f" ORDER BY {order_sql} LIMIT ? OFFSET ?",
+        f"SELECT {_IMAGE_ROW_COLS}, COUNT(*) OVER() AS _total "
+        + base + f" ORDER BY {order_sql} LIMIT ? OFFSET ?",
         params + [limit, offset],
     )
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    raw = cur.fetchall()
+    rows = [ImageRow._make(r[:-1]) for r in raw]
+    if raw:
+        return rows, raw[0][-1]
+    if offset == 0:
+        return rows, 0
+    return rows, count_images_by_arch_cat(dataset_id, archetype, category, decision_filter)
 
 def _now_iso() -> str:
     """UTC timestamp suitable for updated_at."""
@@ -348,27 +711,34 @@ def _normalize_decision(val: Optional[str]) -> Optional[str]:
     # anything else stays as-is and will be validated against VALID_DECISIONS
     return v
 
+def _tuple_cursor() -> sqlite3.Cursor:
+    cur = get_conn().cursor()
+    cur.row_factory = None
+    return cur
+
 def image_path_to_id_map(dataset_id: int) -> Dict[str, int]:
     """
     Map: relative image_path (with forward slashes) -> image_id
     """
-    conn = get_conn()
-    rows = conn.execute(
-        "SELECT id, image_path FROM images WHERE dataset_id=?", (dataset_id,)
-    ).fetchall()
-    return {r["image_path"].replace("\\", "/"): r["id"] for r in rows}
+    # slash normalization happens in SQLite; the dict is built straight off a
+    # plain-tuple cursor (no sqlite3.Row per image)
+    cur = _tuple_cursor()
+    cur.execute(
+        "SELECT REPLACE(image_path, '\\', '/'), id FROM images WHERE dataset_id=?", (dataset_id,)
+    )
+    return dict(cur)
 
 def existing_decisions_map(dataset_id: int) -> Dict[int, Tuple[Optional[str], Optional[str]]]:
     """
     Map: image_id -> (decision, updated_at ISO)
     """
-    conn = get_conn()
-    rows = conn.execute(
+    cur = _tuple_cursor()
+    cur.execute(
         "SELECT i.id AS image_id, d.decision, d.updated_at "
         "FROM images i LEFT JOIN decisions d ON d.image_id=i.id "
         "WHERE i.dataset_id=?", (dataset_id,)
-    ).fetchall()
-    return {r["image_id"]: (r["decision"], r["updated_at"]) for r in rows}
+    )
+    return {image_id: (dec, ts) for image_id, dec, ts in cur}
 
 def _parse_ts(s: Optional[str]) -> Optional[datetime]:
     if not s:
@@ -400,6 +770,10 @@ def bulk_import_decisions_from_rows(
     rel_to_id = image_path_to_id_map(dataset_id)
     existing = existing_decisions_map(dataset_id)
 
+    # hoisted: abspath() does a getcwd() syscall, too costly to repeat per row
+    root_norm = os.path.abspath(root_dir) if root_dir else ""
+    root_prefix = os.path.join(root_norm, "") if root_norm else ""  # with trailing sep
+
     def rel_from_row(r: dict) -> Optional[str]:
         # prefer explicit relative path
         p = (r.get("image_path") or "").strip()
@@ -407,10 +781,14 @@ def bulk_import_decisions_from_rows(
             return p.replace("\\", "/")
         # else try to derive from abs_path
         ap = (r.get("abs_path") or "").strip()
-        if ap and root_dir:
+        if ap and root_norm:
+            # fast path: our own exports write abs_path as root_dir + image_path
+            if ap.startswith(root_prefix):
+                rel = ap[len(root_prefix):].replace("\\", "/")
+                if rel in rel_to_id:
+                    return rel
             try:
                 ap_norm = os.path.abspath(ap)
-                root_norm = os.path.abspath(root_dir)
                 if ap_norm.startswith(root_norm):
                     rel = os.path.relpath(ap_norm, root_norm)
                     return rel.replace("\\", "/")
@@ -418,56 +796,53 @@ def bulk_import_decisions_from_rows(
                 return None
         return None
 
-    conn = get_conn()
-    cur = conn.cursor()
-
     stats = {"upserted": 0, "cleared": 0, "skipped_missing": 0, "skipped_older": 0, "invalid_decision": 0}
+    # (sql, params) in CSV order; consecutive runs of the same statement go out
+    # via executemany, flushed every _IMPORT_FLUSH_ROWS so memory stays bounded
+    ops = []
 
-    for r in rows:
-        rel = rel_from_row(r)
-        if not rel or rel not in rel_to_id:
-            stats["skipped_missing"] += 1
-            continue
-
-        image_id = rel_to_id[rel]
-
-        # normalize and validate the incoming decision
-        dec_norm = _normalize_decision(r.get("decision"))
-        incoming_ts = _parse_ts(r.get("updated_at")) or datetime.utcnow()
-        incoming_iso = incoming_ts.isoformat(timespec="seconds") + "Z"
-
-        # newer-wins guard
-        exist_dec, exist_ts = existing.get(image_id, (None, None))
-        exist_dt = _parse_ts(exist_ts)
-        if prefer_newer and exist_dt and incoming_ts <= exist_dt:
-            stats["skipped_older"] += 1
-            continue
-
-        if dec_norm is None:
-            # clear decision (send back to unmarked)
-            cur.execute("DELETE FROM decisions WHERE image_id=?", (image_id,))
-            stats["cleared"] += 1
-            existing[image_id] = (None, None)
-            continue
-
-        if dec_norm not in VALID_DECISIONS:
-            stats["invalid_decision"] += 1
-            continue
-
-        # upsert decision
-        cur.execute(
-            """
-            INSERT INTO decisions(image_id, decision, note, updated_at)
-            VALUES(?,?,?,?)
-            ON CONFLICT(image_id) DO UPDATE SET
-              decision=excluded.decision,
-              note=COALESCE(excluded.note, decisions.note),
-              updated_at=excluded.updated_at
-            """,
-            (image_id, dec_norm, (r.get("note") or None), incoming_iso),
-        )
-        stats["upserted"] += 1
-        existing[image_id] = (dec_norm, incoming_iso)
+    def flush():
+        for sql, group in groupby(ops, key=lambda op: op[0]):
+            conn.executemany(sql, [params for _sql, params in group])
+        ops.clear()
 
-    conn.commit()
+    conn = get_conn()
+    with _write_txn(conn):
+        for r in rows:
+            rel = rel_from_row(r)
+            if not rel or rel not in rel_to_id:
+                stats["skipped_missing"] += 1
+                continue
+
+            image_id = rel_to_id[rel]
+
+            # normalize and validate the incoming decision
+            dec_norm = _normalize_decision(r.get("decision"))
+            incoming_ts = _parse_ts(r.get("updated_at")) or datetime.utcnow()
+            incoming_iso = incoming_ts.isoformat(timespec="seconds") + "Z"
+
+            # newer-wins guard
+            exist_dec, exist_ts = existing.get(image_id, (None, None))
+            exist_dt = _parse_ts(exist_ts)
+            if prefer_newer and exist_dt and incoming_ts <= exist_dt:
+                stats["skipped_older"] += 1
+                continue
+
+            if dec_norm is None:
+                # clear decision (send back to unmarked)
+                ops.append((_CLEAR_DECISION_SQL, (image_id,)))
+                stats["cleared"] += 1
+                existing[image_id] = (None, None)
+            elif dec_norm not in VALID_DECISIONS:
+                stats["invalid_decision"] += 1
+                continue
+            else:
+                # upsert decision
+                ops.append((_UPSERT_DECISION_SQL, (image_id, dec_norm, (r.get("note") or None), incoming_iso)))
+                stats["upserted"] += 1
+                existing[image_id] = (dec_norm, incoming_iso)
+
+            if len(ops) >= _IMPORT_FLUSH_ROWS:
+                flush()
+        flush()
     return stats
\ No newline at end of file
@@ -1,10 +1,87 @@
 import argparse
 import os
 import sys
+from typing import Iterator
 import pandas as pd
-from db import init_db, upsert_dataset, insert_images
+from db import init_db, upsert_dataset, insert_images, analyze
+
+try:  # optional: faster, multi-threaded CSV parsing
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
 
 REQUIRED_COLS = ["image_name", "image_path"]
+CHUNK_ROWS = 100_000      # pandas fallback: rows per chunk
+CHUNK_BYTES = 32 << 20    # pyarrow: bytes of CSV text per record batch
+
+def _arrow_chunks(csv_path: str) -> Iterator[pd.DataFrame]:
+    """
+    Stream the CSV with pyarrow's multi-threaded reader, one record batch
+    (~CHUNK_BYTES of text) at a time. Batches convert to plain numpy-backed
+    DataFrames, so values come out as pd.read_csv gives them (e.g. an integer
+    column with blanks as floats, image_name '000' as 0 -> '0') and a fallback
+    to pandas part-way through doesn't mix two representations in a dataset.
+    """
+    read_options = pacsv.ReadOptions(use_threads=True, block_size=CHUNK_BYTES)
+    # Peek at the schema the real read will use (types are fixed from its
+    # first block, so same block size). Date/time columns stay as their
+    # original text, as with pd.read_csv, so the metadata is JSON-serializable.
+    with pacsv.open_csv(csv_path, read_options=read_options) as reader:
+        schema = reader.schema
+    column_types = {f.name: pa.string() for f in schema if pa.types.is_temporal(f.type)}
+    # Arrow reads integers wider than int64 as doubles; pd.read_csv keeps
+    # them as their text. Double columns with no decimal point or exponent in
+    # the first block are such integers, so keep those as text too.
+    doubles = [f.name for f in schema if pa.types.is_floating(f.type)]
+    if doubles:
+        peek_types = dict(column_types, **{name: pa.string() for name in doubles})
+        with pacsv.open_csv(
+            csv_path,
+            read_options=read_options,
+            convert_options=pacsv.ConvertOptions(
+                include_columns=doubles, column_types=peek_types, strings_can_be_null=True
+            ),
+        ) as reader:
+            first = reader.read_next_batch()
+        for name in doubles:
+            text = first.column(name).drop_null().to_pylist()
+            if not any(c in v for v in text for c in ".eEnN"):
+                column_types[name] = pa.string()
+    with pacsv.open_csv(
+        csv_path,
+        read_options=read_options,
+        convert_options=pacsv.ConvertOptions(column_types=column_types, strings_can_be_null=True),
+    ) as reader:
+        for batch in reader:
+            yield batch.to_pandas()
+
+def _iter_csv_chunks(csv_path: str) -> Iterator[pd.DataFrame]:
+    """
+    Yields the CSV as bounded DataFrame chunks so peak memory doesn't grow with
+    file size. Falls back to pd.read_csv(chunksize=...) if pyarrow is missing or
+    its type inference trips over a later block; rows already stored from the
+    arrow pass are skipped by insert_images' INSERT OR IGNORE.
+    """
+    if pa is not None:
+        try:
+            yield from _arrow_chunks(csv_path)
+            return
+        except pa.ArrowInvalid:
+            pass
+    yield from pd.read_csv(csv_path, chunksize=CHUNK_ROWS)
+
+def _build_rows(df: pd.DataFrame):
+    """
+    Vectorized (image_name, image_path, metadata_dict) tuples for insert_images.
+    Missing metadata cells become None; to_dict yields native Python scalars.
+    """
+    names = list(map(str, df["image_name"].tolist()))
+    paths = list(map(str, df["image_path"].tolist()))
+    meta_df = df.drop(columns=REQUIRED_COLS)
+    meta_df = meta_df.astype(object).where(pd.notna(meta_df), None)
+    metas = meta_df.to_dict(orient="records")
+    return list(zip(names, paths, metas))
 
 def ingest(dataset_name: str, root_dir: str, csv_path: str):
     if not os.path.isdir(root_dir):
@@ -14,23 +91,19 @@ def ingest(dataset_name: str, root_dir: str, csv_path: str):
         print(f"[ERR] CSV not found: {csv_path}")
         sys.exit(1)
 
-    df = pd.read_csv(csv_path)
+    header = pd.read_csv(csv_path, nrows=0).columns
     for c in REQUIRED_COLS:
-        if c not in df.columns:
+        if c not in header:
             print(f"[ERR] Missing required column: {c}")
             sys.exit(1)
 
-    # Build rows: (image_name, image_path, metadata_dict)
-    rows = []
-    other_cols = [c for c in df.columns if c not in REQUIRED_COLS]
-    for _, r in df.iterrows():
-        name = str(r["image_name"])
-        rel_path = str(r["image_path"])
-        meta = {c: (None if pd.isna(r[c]) else r[c]) for c in other_cols}
-        rows.append((name, rel_path, meta))
-
     dataset_id = upsert_dataset(dataset_name, os.path.abspath(root_dir))
-    inserted = insert_images(dataset_id, rows)
+    inserted = 0
+    for chunk in _iter_csv_chunks(csv_path):
+        # Build rows: (image_name, image_path, metadata_dict); one transaction per chunk
+        inserted += insert_images(dataset_id, _build_rows(chunk))
+    if inserted:
+        analyze()
     print(f"[OK] Dataset='{dataset_name}' (id={dataset_id}). Inserted {inserted} images.")
 
 if __name__ == "__main__":
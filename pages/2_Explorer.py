@@ -1,25 +1,119 @@
+import base64
+import html
+import io
 import os
-import math
+import stat
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+from PIL import Image, ImageOps
 from db import (
     init_db,
+    get_conn,
     get_datasets,
     get_archetype_tree,
-    images_by_arch_cat,
     count_images_by_arch_cat,
-    set_decision,
+    images_by_arch_cat,
+    page_images_by_arch_cat,
+    set_decisions_bulk,
+    data_version,
+    catalog_version,
 )
 
 st.set_page_config(page_title="Explorer • DatasetCleaner", layout="wide")
-init_db()
 
-# ---- apply pending resets BEFORE widgets are created ----
-if "_explorer_pending" in st.session_state:
-    p = st.session_state.pop("_explorer_pending")
-    if p.get("reset_filter"):
-        st.session_state["explorer_decision_filter"] = "all"
-    if p.get("reset_page"):
-        st.session_state["explorer_page"] = 0
+@st.cache_resource
+def _db_conn():
+    # one shared connection (and one schema check) for all sessions and reruns
+    init_db()
+    return get_conn()
+
+_db_conn()
+
+# Datasets and the archetype tree only change on ingest. Keyed on
+# db.catalog_version() (ingest writes only, not decisions) so in-process
+# ingests show up at once without re-reading per decision click; the TTL bounds
+# staleness for writes from other processes (e.g. the ingest CLI).
+@st.cache_data(ttl=300, show_spinner=False, max_entries=8)
+def _cached_datasets(version):
+    return [dict(r) for r in get_datasets()]
+
+@st.cache_data(ttl=300, show_spinner=False, max_entries=16)
+def _cached_tree(version, dsid):
+    return get_archetype_tree(dsid)
+
+def ceildiv(a, b):
+    # integer ceil(a / b): no float division, exact for any total
+    return -(-a // b)
+
+THUMB_SIZE = 256
+
+@st.cache_data(max_entries=4096, show_spinner=False)
+def thumb(abs_path, mtime, size=THUMB_SIZE):
+    """
+    Small WEBP for a grid tile, keyed on mtime so edited files re-render.
+    Returns None if Pillow can't decode or convert the file.
+    """
+    try:
+        with Image.open(abs_path) as im:
+            im.draft("RGB", (size, size))  # JPEG: decode at reduced scale
+            im = ImageOps.exif_transpose(im)
+            # before resizing: thumbnail() can't resample e.g. I;16 / I grayscale
+            if im.mode not in ("RGB", "RGBA"):
+                im = im.convert("RGB")
+            im.thumbnail((size, size))
+            buf = io.BytesIO()
+            im.save(buf, "WEBP", quality=80)
+            return buf.getvalue()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+@st.cache_resource
+def _thumb_pool():
+    # shared across reruns and sessions; decode/resize/encode release the GIL
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="explorer-thumb")
+
+def _tile_thumb(job):
+    abs_path, mtime = job
+    return None if mtime is None else thumb(abs_path, mtime)
+
+def _tile_mtimes(root_dir, rels):
+    """
+    mtime (or None if missing / not a file) per relative path: one stat per
+    tile gives both existence and mtime, instead of an isfile + getmtime pair.
+    Per-file rather than a directory scan, since image folders are often flat
+    and a listing would cost O(entries in the folder) for one page.
+    """
+    out = []
+    for rel in rels:
+        try:
+            info = os.stat(os.path.join(root_dir, rel))
+        except OSError:
+            out.append(None)
+            continue
+        out.append(info.st_mtime if stat.S_ISREG(info.st_mode) else None)
+    return out
+
+@st.cache_resource
+def _prefetch_pool():
+    # one worker: at most one neighbour page warming at a time
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="explorer-prefetch")
+
+def _prefetch_page(dataset_id, arch, cat, decision_filter, after, root_dir):
+    # warm the thumb cache for the first chunk of the page following `after`
+    rows = images_by_arch_cat(
+        dataset_id, arch, cat,
+        decision_filter=decision_filter,
+        order_by="image_path",
+        limit=CHUNK, after=after
+    )
+    rels = [r.image_path for r in rows]
+    jobs = zip((os.path.join(root_dir, rel) for rel in rels), _tile_mtimes(root_dir, rels))
+    list(_thumb_pool().map(_tile_thumb, jobs))
+
+def defer():
+    # state changed after some widgets already rendered: rerun once, at the end
+    st.session_state["_needs_rerun"] = True
 
 # Densify layout
 st.markdown("""
@@ -32,7 +126,11 @@ section[data-testid="stSidebar"] > div {padding-top: 0.6rem;}
 st.title("explorer")
 
 # ===== Sidebar: dataset + archetype/category tree =====
-datasets = get_datasets()
+if st.sidebar.button("🔄 Refresh", key="explorer_refresh"):
+    _cached_datasets.clear()
+    _cached_tree.clear()
+
+datasets = _cached_datasets(catalog_version())
 if not datasets:
     st.sidebar.info("No datasets yet. Use the main page to ingest a CSV.")
     st.stop()
@@ -46,28 +144,51 @@ ds = datasets[ds_idx]
 dataset_id = ds["id"]
 root_dir = ds["root_dir"]
 
-tree = get_archetype_tree(dataset_id)
+tree = _cached_tree(catalog_version(), dataset_id)
 if not tree:
     st.sidebar.info("No archetype/category keys found in metadata_json.")
     st.stop()
 
 st.sidebar.markdown("#### Context Archetypes")
 
-# Selection state
-st.session_state.setdefault("explorer_arch", None)
-st.session_state.setdefault("explorer_cat", None)
+# Selection state (explorer_arch / explorer_cat are owned by the widgets below)
 st.session_state.setdefault("explorer_page", 0)
 st.session_state.setdefault("explorer_decision_filter", "all")
+st.session_state.setdefault("explorer_visible_chunks", 1)
+
+# drop a selection the current dataset's tree doesn't have (dataset switch)
+if st.session_state.get("explorer_arch") not in tree:
+    st.session_state["explorer_arch"] = None
+if st.session_state.get("explorer_cat") not in tree.get(st.session_state["explorer_arch"], ()):
+    st.session_state["explorer_cat"] = None
 
-for arche in tree.keys():
-    with st.sidebar.expander(arche, expanded=(st.session_state["explorer_arch"] == arche)):
-        for c in tree[arche]:
-            if st.button(c, key=f"arch_{arche}_cat_{c}"):
-                st.session_state["explorer_arch"] = arche
-                st.session_state["explorer_cat"] = c
-                # request resets for next rerun (before widgets instantiate)
-                st.session_state["_explorer_pending"] = {"reset_filter": True, "reset_page": True}
-                st.rerun()
+def _on_pick_arch():
+    st.session_state["explorer_cat"] = None
+
+def _on_pick_cat():
+    # callbacks run before the script, so these land before the widgets do
+    st.session_state["explorer_decision_filter"] = "all"
+    st.session_state["explorer_page"] = 0
+    st.session_state["explorer_visible_chunks"] = 1
+
+# Two widgets instead of a button per category; the session (and its
+# cursors, totals and prefetch) survives every pick
+st.sidebar.selectbox(
+    "Archetype",
+    list(tree.keys()),
+    index=None,
+    placeholder="Choose an archetype",
+    key="explorer_arch",
+    on_change=_on_pick_arch,
+)
+if st.session_state["explorer_arch"] is not None:
+    st.sidebar.radio(
+        "Location category",
+        tree[st.session_state["explorer_arch"]],
+        index=None,
+        key="explorer_cat",
+        on_change=_on_pick_cat,
+    )
 
 # ===== Main: grid of thumbnails with decision + CLEAR =====
 arch = st.session_state.get("explorer_arch")
@@ -79,76 +200,185 @@ if not arch or not cat:
 
 # --- NEW: per-category decision filter ---
 filter_options = ["all", "keep", "discard", "unsure", "unmarked"]
-# read default safely
-default_filter = st.session_state.get("explorer_decision_filter", "all")
-idx = filter_options.index(default_filter) if default_filter in filter_options else 0
+# value comes from session_state (seeded above, reset by _on_pick_cat); an
+# index= on top of that would re-key the widget whenever it changes
+if st.session_state["explorer_decision_filter"] not in filter_options:
+    st.session_state["explorer_decision_filter"] = "all"
 
 selected_filter = st.radio(
     "Label filter",
     filter_options,
-    index=idx,
     horizontal=True,
     key="explorer_decision_filter",   # let Streamlit manage session_state
 )
 # use `selected_filter` (or st.session_state["explorer_decision_filter"]) below
+# passed straight into SQL (d.decision = ? / d.image_id IS NULL); None means no filter
 decision_filter = None if selected_filter == "all" else selected_filter
-df_arg = None if decision_filter == "all" else decision_filter
+df_arg = decision_filter
 
 PAGE_SIZE = 48
+CHUNK = 12  # tiles rendered per "Load more" step; the page is still fetched whole
 page = st.session_state.get("explorer_page", 0)
 
-total = count_images_by_arch_cat(dataset_id, arch, cat, decision_filter=df_arg)
-num_pages = max(1, math.ceil(total / PAGE_SIZE))
+TOTAL_CACHE_MAX = 64
+
+# Totals per (dataset, archetype, category, filter), stamped with the
+# data_version they were counted at: any decision write bumps the version, so
+# a stale entry is simply recounted. Unchanged since last rerun -> rows only.
+total_cache = st.session_state.setdefault("_total_cache", OrderedDict())
+total_key = (dataset_id, arch, cat, df_arg)
+
+# Keyset pagination: per (dataset, archetype, category, filter), the
+# image_path each visited page starts after (None for page 0). Next pushes
+# the current page's last path, Prev pops. A page without a cursor (e.g. after
+# the clamp below) falls back to OFFSET.
+cursor_stacks = st.session_state.setdefault("_explorer_cursors", {})
+cursors = cursor_stacks.setdefault(total_key, [None])
+
+def _fetch_page(page):
+    after = cursors[page] if page < len(cursors) else None
+    offset = 0 if (page == 0 or after is not None) else page * PAGE_SIZE
+    version = data_version()
+    hit = total_cache.get(total_key)
+    if hit is not None and hit[0] == version:
+        total_cache.move_to_end(total_key)
+        rows = images_by_arch_cat(
+            dataset_id, arch, cat,
+            decision_filter=df_arg,
+            order_by="image_path",
+            limit=PAGE_SIZE, offset=offset, after=after
+        )
+        return rows, hit[1]
+    if after is None:
+        # Rows and total from one query
+        rows, total = page_images_by_arch_cat(
+            dataset_id, arch, cat,
+            decision_filter=df_arg,
+            order_by="image_path",
+            limit=PAGE_SIZE, offset=offset
+        )
+    else:
+        # a windowed count would only see rows past the cursor
+        rows = images_by_arch_cat(
+            dataset_id, arch, cat,
+            decision_filter=df_arg,
+            order_by="image_path",
+            limit=PAGE_SIZE, after=after
+        )
+        total = count_images_by_arch_cat(dataset_id, arch, cat, decision_filter=df_arg)
+    total_cache[total_key] = (version, total)
+    total_cache.move_to_end(total_key)
+    while len(total_cache) > TOTAL_CACHE_MAX:
+        total_cache.popitem(last=False)
+    return rows, total
+
+rows, total = _fetch_page(page)
+num_pages = max(1, ceildiv(total, PAGE_SIZE))
 # Clamp page if filter changed and shrank the result
 if page > num_pages - 1:
     page = max(0, num_pages - 1)
     st.session_state["explorer_page"] = page
+    rows, total = _fetch_page(page)
 
 offset = page * PAGE_SIZE
 
-rows = images_by_arch_cat(
-    dataset_id, arch, cat,
-    decision_filter=df_arg,
-    order_by="image_path",
-    limit=PAGE_SIZE, offset=offset
-)
-
-def badge(dec):
-    return "✅ keep" if dec == "keep" else ("🗑️ discard" if dec == "discard" else ("🤔 unsure" if dec == "unsure" else "—"))
+BADGE_MAP = {"keep": "✅ keep", "discard": "🗑️ discard", "unsure": "🤔 unsure"}
 
 st.subheader(f"{arch} ▸ {cat}")
 st.caption(f"Showing {offset + 1 if total else 0}–{min(offset + PAGE_SIZE, total)} of {total}  •  filter: {decision_filter}")
 
+# Only the first N chunks of the page are rendered (and thumbnailed)
+visible = rows[:st.session_state["explorer_visible_chunks"] * CHUNK]
+# Per-tile strings computed once so the render loop only reads them
+prepped = [
+    (
+        r.id,
+        r.image_path,
+        os.path.join(root_dir, r.image_path),
+        os.path.basename(r.image_path),
+        BADGE_MAP.get(r.decision, "—"),
+    )
+    for r in visible
+]
+
+# Existence + mtime for the rendered tiles
+tile_mtimes = _tile_mtimes(root_dir, [p[1] for p in prepped])
+
+# Encode the rendered tiles' thumbnails concurrently; cache hits return at once
+thumbs = list(_thumb_pool().map(_tile_thumb, zip((p[2] for p in prepped), tile_mtimes)))
+
 cols_per_row = 6
-rows_needed = math.ceil(len(rows) / cols_per_row) if rows else 0
-
-for r_i in range(rows_needed):
-    cols = st.columns(cols_per_row, gap="small")
-    for c_i in range(cols_per_row):
-        idx = r_i * cols_per_row + c_i
-        if idx >= len(rows):
-            break
-        r = rows[idx]
-        abs_path = os.path.join(root_dir, r["image_path"])
-        with cols[c_i]:
-            st.caption(os.path.basename(r["image_path"]))
-            if os.path.isfile(abs_path):
-                st.image(abs_path, use_column_width=True)
-            else:
-                st.error("missing")
-            st.caption(badge(r["decision"]))
-            if st.button("Clear", key=f"clr_{r['id']}_{page}", help="Remove decision (send to unmarked)"):
-                set_decision(r["id"], None, None)
-                # If we were filtering to non-unmarked, removing may reduce total; keep page stable
-                st.rerun()
+rows_needed = ceildiv(len(prepped), cols_per_row)
+
+# Tick "clear" on any tiles, then Apply once: one batched write + one rerun
+with st.form("grid", clear_on_submit=True, border=False):
+    to_clear = []
+    for r_i in range(rows_needed):
+        cols = st.columns(cols_per_row, gap="small")
+        for c_i in range(cols_per_row):
+            idx = r_i * cols_per_row + c_i
+            if idx >= len(prepped):
+                break
+            image_id, rel, abs_path, base, badge = prepped[idx]
+            with cols[c_i]:
+                st.caption(base)
+                if tile_mtimes[idx] is not None:
+                    data = thumbs[idx]
+                    if data is not None:
+                        # inline <img>: the browser defers decoding offscreen tiles
+                        st.markdown(
+                            f'<img src="data:image/webp;base64,{base64.b64encode(data).decode()}" '
+                            f'alt="{html.escape(base)}" loading="lazy" decoding="async" style="width:100%">',
+                            unsafe_allow_html=True,
+                        )
+                    else:
+                        st.error("unreadable")
+                else:
+                    st.error("missing")
+                st.caption(badge)
+                if st.checkbox("clear", key=f"clr_{image_id}", help="Remove decision (send to unmarked) on Apply"):
+                    to_clear.append(image_id)
+    if st.form_submit_button("Apply clears") and to_clear:
+        set_decisions_bulk(to_clear, None, None)
+        # If we were filtering to non-unmarked, removing may reduce total; keep page stable
+        defer()
+
+if len(visible) < len(rows):
+    if st.button(f"Load {min(CHUNK, len(rows) - len(visible))} more ↓", key="explorer_more"):
+        st.session_state["explorer_visible_chunks"] += 1
+        defer()
 
 # Pager
 pg = st.columns([1, 1, 3])
 if pg[0].button("⟵ Prev page", disabled=(page <= 0)):
+    del cursors[page:]
     st.session_state["explorer_page"] = max(0, page - 1)
-    st.rerun()
-if pg[1].button("Next page ⟶", disabled=(page >= num_pages - 1)):
+    st.session_state["explorer_visible_chunks"] = 1
+    defer()
+if pg[1].button("Next page ⟶", disabled=(page >= num_pages - 1 or not rows)):
+    del cursors[page + 1:]
+    cursors += [None] * (page + 1 - len(cursors))  # pages reached by OFFSET
+    cursors.append(rows[-1].image_path)
     st.session_state["explorer_page"] = min(num_pages - 1, page + 1)
-    st.rerun()
+    st.session_state["explorer_visible_chunks"] = 1
+    defer()
 with pg[2]:
     st.caption(f"Page {page + 1 if total else 0} / {num_pages}")
+
+# Next is the likely click: warm its first chunk while this page is studied.
+# One outstanding job per session; a different target cancels the old one.
+if page < num_pages - 1 and rows:
+    prefetch_key = (dataset_id, arch, cat, df_arg, rows[-1].image_path)
+    prev = st.session_state.get("_prefetch_future")
+    if prev is None or prev[0] != prefetch_key:
+        if prev is not None:
+            prev[1].cancel()
+        st.session_state["_prefetch_future"] = (
+            prefetch_key,
+            _prefetch_pool().submit(
+                _prefetch_page, dataset_id, arch, cat, df_arg, rows[-1].image_path, root_dir
+            ),
+        )
+
+if st.session_state.pop("_needs_rerun", False):
+    st.rerun()